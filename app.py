@@ -4,19 +4,34 @@ Proxy Manager - 重构后的主应用入口
 """
 
 import os
-import json
-from flask import Flask, render_template, request, Response, jsonify
-from flask_cors import CORS
+import re
+import time
+import gzip
+import zlib
+import queue
+import shlex
+import logging
+import functools
+import threading
+import subprocess
+import orjson
+from flask import Flask, render_template, request, Response, jsonify, g
 from flasgger import Swagger
 
+try:
+    import fcntl  # 仅 POSIX 可用，用于调整管道缓冲区大小
+except ImportError:
+    fcntl = None
+
 # 核心模块
 from core.config import ConfigManager, SettingManager
 from core.path_manager import PathManager
-from core.logger import setup_logging, get_logger
+from core.logger import setup_logging, get_logger, LOG_BANNER
 
 # 工具模块
 from utils.adb_helper import ADBHelper
-from utils.yaml_helper import YAMLHelper, to_json
+from utils.yaml_helper import YAMLHelper
+from utils.json_provider import OrjsonProvider, JSON_PAYLOAD_KEY
 
 # 服务模块
 from services.proxy_service import ProxyService
@@ -30,15 +45,26 @@ from routes import proxy_routes, transit_routes, vm_routes, device_routes, regio
 
 # ==================== 初始化应用 ====================
 
+# 设置管理器（首先初始化，日志系统和其他组件都依赖它）
+setting_manager = SettingManager()
+
 # 配置日志
-setting_manager_temp = SettingManager()
-setup_logging(setting_manager_temp.load())
+setup_logging(setting_manager.load())
 logger = get_logger(__name__)
 
+# 运行模式：APP_DEBUG=1 使用 Flask 调试服务器，PROFILE=1 开启请求性能分析
+DEBUG = os.environ.get("APP_DEBUG") == "1"
+PROFILE = os.environ.get("PROFILE") == "1"
+
 # 创建 Flask 应用
 app = Flask(__name__, template_folder='templates', static_folder='static')
-app.config['JSON_AS_ASCII'] = False
-CORS(app)
+app.json = OrjsonProvider(app)
+
+if PROFILE:
+    # 每个请求输出耗时前 30 的函数，并保存 cProfile 结果（可用 SnakeViz 查看）
+    from werkzeug.middleware.profiler import ProfilerMiddleware
+    os.makedirs('profiler_results', exist_ok=True)
+    app.wsgi_app = ProfilerMiddleware(app.wsgi_app, restrictions=[30], profile_dir='profiler_results')
 
 # 配置 Swagger
 swagger_config = {
@@ -62,9 +88,6 @@ swagger = Swagger(app, config=swagger_config, template_file='docs/swagger/api_sp
 
 # ==================== 初始化核心组件 ====================
 
-# 设置管理器（首先初始化，因为其他组件依赖它）
-setting_manager = SettingManager()
-
 # 路径管理器
 path_manager = PathManager(setting_manager)
 
@@ -84,75 +107,263 @@ region_service = RegionService(setting_manager)
 
 # ==================== 注册路由蓝图 ====================
 
-app.register_blueprint(proxy_routes.create_blueprint(proxy_service))
-app.register_blueprint(transit_routes.create_blueprint(transit_service))
-app.register_blueprint(vm_routes.create_blueprint(vm_service))
-app.register_blueprint(device_routes.create_blueprint(device_service))
-app.register_blueprint(region_routes.create_blueprint(region_service))
-app.register_blueprint(setting_routes.create_blueprint(path_manager, setting_manager))
+_BLUEPRINTS = (
+    (proxy_routes, (proxy_service,)),
+    (transit_routes, (transit_service,)),
+    (vm_routes, (vm_service,)),
+    (device_routes, (device_service,)),
+    (region_routes, (region_service,)),
+    (setting_routes, (path_manager, setting_manager)),
+)
+
+for _module, _args in _BLUEPRINTS:
+    app.register_blueprint(_module.create_blueprint(*_args))
+
+# 启动时一次性完成 URL 规则排序，避免首个请求承担该开销
+app.url_map.update()
+
+# ==================== 中间件：响应压缩 ====================
+# 先于其他 after_request 钩子注册，因此最后执行（日志记录看到的是未压缩的响应）
+
+# SSE 流式响应类型
+_SSE_MIME = 'text/event-stream'
+
+# 可压缩的响应类型及最小压缩大小
+_COMPRESS_MIMETYPES = frozenset(('application/json', 'text/html', _SSE_MIME))
+_COMPRESS_MIN_SIZE = 500
+# 普通响应压缩级别；SSE 每帧都要压缩并刷新，使用最快的级别
+_COMPRESS_LEVEL = 6
+_COMPRESS_STREAM_LEVEL = 1
+# zlib 输出 gzip 格式
+_GZIP_WBITS = zlib.MAX_WBITS | 16
+
+
+def _accepts_gzip():
+    """客户端是否接受 gzip 编码（按质量值解析 Accept-Encoding，gzip;q=0 视为不接受）"""
+    return request.accept_encodings['gzip'] > 0
+
+
+def _gzip_stream(stream):
+    """逐帧 gzip 压缩流式响应，每帧后同步刷新，客户端可立即解压显示"""
+    compressor = zlib.compressobj(_COMPRESS_STREAM_LEVEL, zlib.DEFLATED, _GZIP_WBITS)
+    try:
+        for chunk in stream:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    finally:
+        # 客户端断开时关闭原始生成器，及时结束子进程输出转发
+        close = getattr(stream, 'close', None)
+        if close:
+            close()
+
+
+@app.after_request
+def compress_response(response):
+    """客户端支持时对 JSON/HTML/SSE 响应进行 gzip 压缩"""
+    if (response.mimetype not in _COMPRESS_MIMETYPES
+            or not 200 <= response.status_code < 300
+            or 'Content-Encoding' in response.headers):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    if not _accepts_gzip():
+        return response
+    
+    if response.mimetype == _SSE_MIME:
+        response.response = _gzip_stream(response.response)
+    else:
+        if response.is_streamed:
+            return response
+        data = response.get_data()
+        if len(data) < _COMPRESS_MIN_SIZE:
+            return response
+        response.set_data(gzip.compress(data, _COMPRESS_LEVEL))
+    
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+# ==================== 中间件：跨域响应头 ====================
+
+# 局域网管理工具，允许任意来源访问；预检请求由 Flask 自动生成的 OPTIONS 响应处理
+_CORS_HEADERS = (
+    ('Access-Control-Allow-Origin', '*'),
+    ('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS'),
+    ('Access-Control-Allow-Headers', 'Content-Type'),
+)
+
+
+@app.after_request
+def add_cors_headers(response):
+    """添加跨域响应头"""
+    headers = response.headers
+    for key, value in _CORS_HEADERS:
+        headers[key] = value
+    return response
+
 
 # ==================== 中间件：请求日志记录 ====================
 
+# 需要脱敏的字段名（可在 setting.yaml 的 logging.redact_keys 中追加，启动时读取一次）
+_EXTRA_REDACT_KEYS = (setting_manager.load().get('logging') or {}).get('redact_keys') or ()
+# 只写了单个字段名（标量）时按单元素列表处理，避免被逐字符拆分
+if isinstance(_EXTRA_REDACT_KEYS, str):
+    _EXTRA_REDACT_KEYS = [_EXTRA_REDACT_KEYS]
+_SENSITIVE_KEYS = frozenset((
+    'password', 'token', 'secret', 'api_key', 'authorization', 'cookie',
+    *(str(key).lower() for key in _EXTRA_REDACT_KEYS),
+))
+
+# 敏感字段脱敏：标量值直接在原始 JSON 文本上替换，避免拷贝和递归遍历请求体
+_SENSITIVE_KEYS_PATTERN = '|'.join(map(re.escape, sorted(_SENSITIVE_KEYS)))
+_REDACT_RE = re.compile(
+    r'"(' + _SENSITIVE_KEYS_PATTERN + r')"\s*:\s*'
+    r'(?:"[^"\\]*(?:\\.[^"\\]*)*"|-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null)',
+    re.I
+)
+_REDACT_SUB = r'"\1": "******"'
+# 敏感字段的值为对象或数组时，文本替换无法确定值的结束位置，改为解析后按结构脱敏
+_REDACT_NESTED_RE = re.compile(r'"(?:' + _SENSITIVE_KEYS_PATTERN + r')"\s*:\s*[\[{]', re.I)
+# 键名含 JSON 转义（如 "pass\u0077ord"）时文本匹配无法识别，同样改为解析后脱敏
+_ESCAPED_KEY_RE = re.compile(r'[{,]\s*"[^"\\]*\\')
+# 需要解析后脱敏但无法解析的请求体，整体隐藏
+_REDACTED_BODY = '[请求体无法解析，为避免泄露敏感字段已隐藏]'
+
+# 请求/响应体日志最大长度，超出部分截断
+_LOG_BODY_MAX = int(os.environ.get("LOG_BODY_MAX", 4096))
+
+# 不记录请求日志的接口（SSE 流式接口自行记录日志）
+_LOG_SKIP_PATHS = frozenset({"/api/vm/new", "/api/vm/save", "/api/vm/load"})
+
+# 需要记录请求体的请求方法
+_BODY_METHODS = frozenset(('POST', 'PUT', 'PATCH'))
+
+# 表单请求体类型（其他类型不解析 request.form）
+_FORM_MIMETYPES = frozenset(('application/x-www-form-urlencoded', 'multipart/form-data'))
+
+
 @app.before_request
 def log_request():
     """记录所有请求信息（简洁版）"""
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    
+    # 请求属性只读取一次，后续直接使用局部变量
+    method = request.method
+    path = request.path
+    if path in _LOG_SKIP_PATHS:
+        return
+    
     log_data = {
-        'method': request.method,
-        'path': request.path,
-        'client': request.remote_addr
+        'method': method,
+        'path': path,
+        'client': request.environ.get('REMOTE_ADDR')
     }
     
-    # 添加查询参数
-    if request.args:
-        log_data['query'] = dict(request.args)
+    # 添加查询参数（先检查原始查询字符串，没有参数时不解析 request.args）
+    if request.query_string:
+        log_data['query'] = _mask_fields(request.args.to_dict())
     
-    # 添加请求体
-    if request.method in ['POST', 'PUT', 'PATCH']:
+    # 添加请求体（原始数据会被缓存，视图函数中的 request.json 不会再次读取请求流）
+    raw_body = None
+    oversized_body = 0
+    content_length = request.content_length
+    if method in _BODY_METHODS and content_length:
         if request.is_json:
-            data = request.get_json(silent=True) or {}
-            log_data['body'] = _sanitize_log_data(data.copy())
-        elif request.form:
-            log_data['form'] = dict(request.form)
+            # 超出日志上限的请求体只记录大小，不读取、不脱敏，大请求不承担日志开销
+            if content_length > _LOG_BODY_MAX:
+                oversized_body = content_length
+            else:
+                raw_body = request.get_data(cache=True, as_text=True)
+        elif request.mimetype in _FORM_MIMETYPES:
+            log_data['form'] = _mask_fields(request.form.to_dict())
+    
+    logger.info("📥 %s %s | %s", method, path, _log_json(log_data))
     
-    logger.info(f"📥 {request.method} {request.path} | {json.dumps(log_data, ensure_ascii=False, default=str)}")
+    if raw_body:
+        # 先脱敏再截断（脱敏后的掩码可能略长于原值），避免截断后的半个字段绕过脱敏
+        body = _sanitize_log_data(raw_body)
+        if len(body) > _LOG_BODY_MAX:
+            body = body[:_LOG_BODY_MAX] + '...[truncated]'
+        logger.info("   请求数据: %s", body)
+    elif oversized_body:
+        logger.info("   请求数据: [%d 字节，超出日志上限 %d，未记录]", oversized_body, _LOG_BODY_MAX)
 
 
 @app.after_request
 def log_response(response):
     """记录所有响应信息（简洁版）"""
+    if not logger.isEnabledFor(logging.INFO):
+        return response
+    
+    # SSE 等直通/流式响应不记录（请求日志中已跳过，由接口自行记录执行结果）
+    if response.direct_passthrough or response.mimetype == _SSE_MIME:
+        return response
+    
     log_data = {'status': response.status_code}
     
-    # 记录响应体（仅 JSON，且限制长度）
-    if response.content_type and 'application/json' in response.content_type:
-        try:
-            data = response.get_json()
-            if data:
-                log_data['success'] = data.get('success', 'N/A')
-                if not data.get('success'):
-                    log_data['error'] = data.get('error', 'Unknown')
-        except:
-            pass
+    # 仅失败响应记录错误信息：优先使用 jsonify 时保存的原始数据，无需反序列化响应体
+    if response.status_code >= 400:
+        data = g.get(JSON_PAYLOAD_KEY)
+        if (data is None
+                and response.mimetype == 'application/json'
+                and not response.is_streamed
+                and (response.calculate_content_length() or 0) <= _LOG_BODY_MAX):
+            try:
+                data = orjson.loads(response.get_data())
+            except orjson.JSONDecodeError:
+                pass
+        if isinstance(data, dict) and data:
+            log_data['success'] = data.get('success', 'N/A')
+            if not data.get('success'):
+                log_data['error'] = data.get('error', 'Unknown')
     
-    logger.info(f"📤 {response.status_code} | {json.dumps(log_data, ensure_ascii=False, default=str)}")
+    logger.info("📤 %s | %s", response.status_code, _log_json(log_data))
     return response
 
 
-def _sanitize_log_data(data):
-    """脱敏日志数据（隐藏密码等敏感信息）"""
+def _log_json(data):
+    """将日志字段序列化为 JSON 文本（orjson 直接输出 UTF-8，无法识别的类型转为字符串）"""
+    return orjson.dumps(data, default=str).decode()
+
+
+def _sanitize_log_data(raw):
+    """脱敏日志数据（隐藏密码等敏感信息），作用于序列化后的 JSON 文本"""
+    if _REDACT_NESTED_RE.search(raw) or _ESCAPED_KEY_RE.search(raw):
+        try:
+            return _log_json(_mask_tree(orjson.loads(raw)))
+        except orjson.JSONDecodeError:
+            return _REDACTED_BODY
+    return _REDACT_RE.sub(_REDACT_SUB, raw)
+
+
+def _mask_tree(data):
+    """递归脱敏已解析的 JSON 数据：敏感字段无论值是什么类型都替换为掩码"""
     if isinstance(data, dict):
-        for key in ['password', 'token', 'secret', 'api_key']:
-            if key in data:
-                data[key] = '******'
-        for key, value in data.items():
-            if isinstance(value, (dict, list)):
-                data[key] = _sanitize_log_data(value)
-    elif isinstance(data, list):
-        return [_sanitize_log_data(item) for item in data]
+        return {
+            key: '******' if key.lower() in _SENSITIVE_KEYS else _mask_tree(value)
+            for key, value in data.items()
+        }
+    if isinstance(data, list):
+        return [_mask_tree(item) for item in data]
     return data
 
 
+def _mask_fields(fields):
+    """脱敏表单/查询参数字典（原地修改并返回，字段名不区分大小写）"""
+    for key in fields:
+        if key.lower() in _SENSITIVE_KEYS:
+            fields[key] = '******'
+    return fields
+
+
 # ==================== 基础路由 ====================
 
+# 主页模板路径及渲染缓存 (mtime, html_bytes, gzip_bytes)，模板修改后自动重新渲染并压缩
+_INDEX_TEMPLATE = os.path.join(app.root_path, app.template_folder, 'proxy_manager.html')
+_index_cache = (None, b'', b'')
+
+
 @app.route('/')
 def index():
     """
@@ -164,12 +375,289 @@ def index():
       200:
         description: 返回主页HTML
     """
+    global _index_cache
     logger.info("🏠 访问主页")
-    return render_template('proxy_manager.html')
+    
+    # 模板未修改时直接返回缓存的渲染结果；压缩结果一并缓存，每次访问无需重新压缩
+    mtime = os.stat(_INDEX_TEMPLATE).st_mtime_ns
+    cache = _index_cache
+    if cache[0] != mtime:
+        html = render_template('proxy_manager.html').encode('utf-8')
+        cache = _index_cache = (mtime, html, gzip.compress(html, _COMPRESS_LEVEL))
+    
+    if not _accepts_gzip():
+        return Response(cache[1], mimetype='text/html')
+    # 已设置 Content-Encoding，压缩钩子不会再次处理
+    response = Response(cache[2], mimetype='text/html')
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
 
 # ==================== VM 操作的 SSE 流式接口 ====================
 # 注意：这些接口涉及复杂的流式响应，从原 proxy_manager.py 迁移过来
 
+# 预先序列化的 SSE 帧前缀，每行输出只需编码 message 字符串，再一次性拼接成帧
+# （不复用共享的 dict 对象：多个 SSE 流在不同线程中并发执行）
+_SSE_LOG_PREFIX = b'data: {"type":"log","message":'
+_SSE_ERROR_PREFIX = b'data: {"type":"error","message":'
+_SSE_SUCCESS_PREFIX = b'data: {"type":"success","message":'
+_SSE_LOG_BATCH_PREFIX = b'data: {"type":"log_batch","lines":'
+_SSE_EXIT_CODE = b',"exit_code":'
+_SSE_TAIL = b'}\n\n'
+# SSE 注释帧，客户端忽略，仅用于保持连接
+_SSE_HEARTBEAT = b': keepalive\n\n'
+
+
+# 最近一次格式化的时间戳 (秒, 'HH:MM:SS')，同一秒内直接复用
+_ts_cache = (None, '')
+
+
+def _timestamp():
+    """当前本地时间 HH:MM:SS（用于 SSE 日志前缀，同一秒内复用已格式化的字符串）"""
+    global _ts_cache
+    now = int(time.time())
+    sec, text = _ts_cache
+    if sec != now:
+        text = time.strftime('%H:%M:%S', time.localtime(now))
+        _ts_cache = (now, text)
+    return text
+
+
+def _sse_frame(prefix, message, exit_code=None):
+    """构建一帧 SSE 消息（bytes）"""
+    if exit_code is None:
+        return b''.join((prefix, orjson.dumps(message), _SSE_TAIL))
+    return b''.join((prefix, orjson.dumps(message), _SSE_EXIT_CODE, orjson.dumps(exit_code), _SSE_TAIL))
+
+
+# 子进程输出每次读取的块大小
+_PIPE_READ_SIZE = 65536
+# Linux 下扩大管道内核缓冲区（F_SETPIPE_SZ 仅 Linux 提供，macOS/BSD 及 Windows 下为 None，不做调整）
+_F_SETPIPE_SZ = getattr(fcntl, 'F_SETPIPE_SZ', None)
+_PIPE_BUFFER_SIZE = 1 << 20
+
+
+def _iter_process_line_batches(process):
+    """
+    按块读取子进程输出，每次读取到的完整行作为一批返回（已去除行尾空白），仅在输出时解码
+    
+    按 \n 分行并去掉行尾的 \r，Windows 下 adb 输出的 \r\n 行尾与原来的通用换行模式一致。
+    """
+    fd = process.stdout.fileno()
+    if _F_SETPIPE_SZ is not None:
+        try:
+            fcntl.fcntl(fd, _F_SETPIPE_SZ, _PIPE_BUFFER_SIZE)
+        except OSError:
+            pass
+    
+    pending = bytearray()
+    while True:
+        chunk = os.read(fd, _PIPE_READ_SIZE)
+        if not chunk:
+            break
+        pending += chunk
+        end = pending.rfind(b'\n')
+        if end < 0:
+            continue
+        yield [line.rstrip(b'\r').decode('utf-8', 'replace').rstrip() for line in pending[:end].split(b'\n')]
+        del pending[:end + 1]
+    
+    # 最后一行可能没有换行符
+    if pending:
+        yield [pending.rstrip(b'\r').decode('utf-8', 'replace').rstrip()]
+
+
+# 合并输出的时间窗口（秒）和单批最大行数
+_COALESCE_WINDOW = 0.02
+_COALESCE_MAX_LINES = 512
+# 脚本长时间无输出时发送心跳的间隔（秒），防止代理或浏览器因空闲断开连接
+_HEARTBEAT_INTERVAL = 15
+
+
+def _iter_coalesced_line_batches(process):
+    """
+    后台线程读取子进程输出，主循环把时间窗口内陆续到达的多批输出合并为一批
+    
+    读取线程持有管道并在读完后关闭；客户端断开时它会继续排空输出直到子进程结束，
+    避免子进程因管道写满而阻塞。超过心跳间隔没有输出时返回空列表。
+    """
+    batches = queue.Queue()
+    
+    def pump():
+        try:
+            for lines in _iter_process_line_batches(process):
+                batches.put(lines)
+        finally:
+            process.stdout.close()
+            batches.put(None)
+    
+    threading.Thread(target=pump, name='vm-stdout-reader', daemon=True).start()
+    
+    while True:
+        try:
+            lines = batches.get(timeout=_HEARTBEAT_INTERVAL)
+        except queue.Empty:
+            yield []
+            continue
+        if lines is None:
+            return
+        deadline = time.monotonic() + _COALESCE_WINDOW
+        while len(lines) < _COALESCE_MAX_LINES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                more = batches.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if more is None:
+                yield lines
+                return
+            lines.extend(more)
+        yield lines
+
+
+# 以 root 身份执行命令的前缀
+_SU_PREFIX = 'su -c '
+
+
+def _build_vm_shell_cmd(action, *args):
+    """构建在设备上以 root 执行 VM 脚本的 shell 命令"""
+    script_cmd = shlex.join(('sh', path_manager.get_vm_script_path(), action, *args))
+    return _SU_PREFIX + shlex.quote(script_cmd)
+
+
+def _adb_shell_cmd(adb_path, device_id, shell_cmd):
+    """构建 adb shell 命令参数列表（指定设备时加 -s 参数）"""
+    if device_id:
+        return [adb_path, '-s', device_id, 'shell', shell_cmd]
+    return [adb_path, 'shell', shell_cmd]
+
+
+# 客户端断开后等待子进程响应 terminate 的时间（秒），超时则强制结束
+_PROCESS_KILL_TIMEOUT = 5
+
+
+def _stream_vm_command(action, args, device_id, name, label, start_message, success_message, on_success=None):
+    """
+    在设备上执行 VM 脚本，并以 SSE 帧的形式实时返回输出
+    
+    Args:
+        action: VM 脚本动作（new/save/load）
+        args: 脚本参数列表
+        device_id: 设备ID（为空时使用默认设备）
+        name: 账号名称（用于日志）
+        label: 操作名称（如 '创建'、'保存'、'加载'）
+        start_message: 开始执行时推送的提示消息
+        success_message: 脚本未返回结构化结果且执行成功时推送的消息
+        on_success: 执行成功后的回调
+    """
+    adb_path = path_manager.get_adb_path()
+    if not adb_path:
+        yield _sse_frame(_SSE_ERROR_PREFIX, 'ADB 路径未配置')
+        return
+    
+    cmd = _adb_shell_cmd(adb_path, device_id, _build_vm_shell_cmd(action, *args))
+    
+    logger.info("执行 VM %s命令: %s", label, ' '.join(cmd))
+    timestamp = _timestamp()
+    yield _sse_frame(_SSE_LOG_PREFIX, f'[{timestamp}] {start_message}')
+    
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        bufsize=_PIPE_READ_SIZE,
+        # POSIX：Python 创建的描述符默认不可继承（PEP 446），无需在 fork 后逐个关闭；
+        # Windows：必须保持 close_fds=True，由 CreateProcess 只继承本进程的管道句柄，
+        # 否则并发启动的其他 adb 子进程可能继承本管道的写端，导致读取端迟迟收不到 EOF
+        close_fds=(os.name == 'nt'),
+        # 子进程放入独立会话，服务进程收到 Ctrl+C 时不会连带中断正在执行的脚本（仅 POSIX 生效）
+        start_new_session=True
+    )
+    
+    # 存储脚本结构化结果
+    script_result = None
+    
+    try:
+        # 实时读取输出：短时间窗口内到达的多行合并为一帧 log_batch，减少写socket次数
+        for lines in _iter_coalesced_line_batches(process):
+            if not lines:
+                yield _SSE_HEARTBEAT
+                continue
+            
+            log_lines = []
+            for line_stripped in lines:
+                # 解析结构化结果: ##RESULT##|status|code|message
+                if line_stripped.startswith('##RESULT##|'):
+                    parts = line_stripped.split('|', 3)
+                    if len(parts) >= 4:
+                        script_result = {
+                            'status': parts[1],
+                            'code': parts[2],
+                            'message': parts[3]
+                        }
+                elif line_stripped:
+                    # 空行不转发，省去一次编码和一帧输出
+                    log_lines.append(line_stripped)
+            
+            if len(log_lines) == 1:
+                yield _sse_frame(_SSE_LOG_PREFIX, log_lines[0])
+            elif log_lines:
+                yield b''.join((_SSE_LOG_BATCH_PREFIX, orjson.dumps(log_lines), _SSE_TAIL))
+        
+        process.wait()
+    finally:
+        # 客户端断开时生成器被关闭，循环后的 wait 不会执行；子进程在独立会话中不会随服务退出，
+        # 需在此结束并回收，避免遗留 adb/su 进程
+        if process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout=_PROCESS_KILL_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+    
+    # 优先使用脚本的结构化结果，兼容旧版本脚本时仅使用返回码判断
+    if script_result:
+        succeeded = script_result['status'] == 'success'
+        message = script_result['message']
+        exit_code = script_result['code']
+    else:
+        succeeded = process.returncode == 0
+        message = success_message if succeeded else f'{label}失败 (返回码: {process.returncode})'
+        exit_code = None
+    
+    if succeeded:
+        if on_success:
+            on_success()
+        yield _sse_frame(_SSE_SUCCESS_PREFIX, message, exit_code)
+        logger.info("✅ VM 账号 '%s' %s成功", name, label)
+    else:
+        yield _sse_frame(_SSE_ERROR_PREFIX, message, exit_code)
+        logger.error("❌ VM 账号%s失败: %s (code: %s)", label, message, exit_code if script_result else process.returncode)
+
+
+# SSE 响应头：禁止缓存，并关闭 nginx 等反向代理的响应缓冲，保证日志实时到达
+_SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+def _sse_response(stream):
+    """构建 SSE 响应（帧已是 bytes，直接交给 WSGI 服务器迭代，不再逐块编码）"""
+    response = Response(stream, mimetype=_SSE_MIME, headers=_SSE_HEADERS)
+    response.direct_passthrough = True
+    return response
+
+
+def _guard_vm_stream(stream, label):
+    """捕获 VM 流式生成器中的异常，并转换为 SSE 错误帧"""
+    try:
+        yield from stream
+    except Exception as e:
+        logger.error("VM %s失败: %s", label, e, exc_info=True)
+        yield _sse_frame(_SSE_ERROR_PREFIX, str(e))
+
+
 @app.route('/api/vm/new', methods=['POST'])
 def vm_create_account():
     """
@@ -218,115 +706,38 @@ def vm_create_account():
           properties:
             type:
               type: string
-              enum: [log, success, error]
+              enum: [log, log_batch, success, error]
               description: 消息类型
             message:
               type: string
               description: 消息内容
+            lines:
+              type: array
+              items:
+                type: string
+              description: 合并的多行日志（仅 log_batch）
     """
-    import subprocess
-    import shlex
-    from datetime import datetime
-    
     # ⚠️ 重要：在生成器外部获取请求数据，避免上下文错误
     data = request.json
     
     def generate(data):
-        try:
-            name = data.get('name', '').strip()
-            app_type = data.get('app_type', '').strip()
-            node = data.get('node', '').strip()
-            region = data.get('region', '').strip().upper()
-            device_id = data.get('device_id', '').strip()
-            
-            if not all([name, app_type, node, region]):
-                yield f"data: {to_json({'type': 'error', 'message': '缺少必需参数'})}\n\n"
-                return
-            
-            adb_path = path_manager.get_adb_path()
-            vm_script_path = path_manager.get_vm_script_path()
-            
-            if not adb_path:
-                yield f"data: {to_json({'type': 'error', 'message': 'ADB 路径未配置'})}\n\n"
-                return
-            
-            # 构建 ADB 命令 - 使用双引号包裹整个命令，内部参数用双引号转义
-            # 将特殊字符进行转义处理
-            def escape_for_shell(s):
-                # 在双引号内转义: $ ` \ " 以及其他特殊字符
-                return s.replace('\\', '\\\\').replace('"', '\\"').replace('$', '\\$').replace('`', '\\`')
-            
-            escaped_name = escape_for_shell(name)
-            escaped_app_type = escape_for_shell(app_type)
-            escaped_node = escape_for_shell(node)
-            escaped_region = escape_for_shell(region)
-            
-            shell_cmd = f'su -c "sh {vm_script_path} new \\"{escaped_name}\\" \\"{escaped_app_type}\\" \\"{escaped_node}\\" \\"{escaped_region}\\""'
-            
-            cmd = [adb_path, 'shell', shell_cmd]
-            if device_id:
-                cmd = [adb_path, '-s', device_id, 'shell', shell_cmd]
-            
-            logger.info(f"执行 VM 创建命令: {' '.join(cmd)}")
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            yield f"data: {to_json({'type': 'log', 'message': f'[{timestamp}] 开始创建 VM 账号: {name}'})}\n\n"
-            
-            # 执行命令
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                encoding='utf-8',
-                errors='replace',
-                bufsize=1
-            )
-            
-            # 存储脚本结构化结果
-            script_result = None
-            
-            # 实时读取输出
-            for line in iter(process.stdout.readline, ''):
-                if line:
-                    line_stripped = line.rstrip()
-                    
-                    # 解析结构化结果: ##RESULT##|status|code|message
-                    if line_stripped.startswith('##RESULT##|'):
-                        parts = line_stripped.split('|', 3)
-                        if len(parts) >= 4:
-                            script_result = {
-                                'status': parts[1],
-                                'code': parts[2],
-                                'message': parts[3]
-                            }
-                    else:
-                        yield f"data: {to_json({'type': 'log', 'message': line_stripped})}\n\n"
-            
-            process.wait()
-            
-            # 优先使用脚本的结构化结果
-            if script_result:
-                if script_result['status'] == 'success':
-                    vm_service.increment_account_counter(app_type, region, device_id or None)
-                    yield f"data: {to_json({'type': 'success', 'message': script_result['message'], 'exit_code': script_result['code']})}\n\n"
-                    logger.info(f"✅ VM 账号 '{name}' 创建成功")
-                else:
-                    yield f"data: {to_json({'type': 'error', 'message': script_result['message'], 'exit_code': script_result['code']})}\n\n"
-                    logger.error(f"❌ VM 账号创建失败: {script_result['message']} (code: {script_result['code']})")
-            else:
-                # 兼容旧版本脚本，仅使用返回码判断
-                if process.returncode == 0:
-                    vm_service.increment_account_counter(app_type, region, device_id or None)
-                    yield f"data: {to_json({'type': 'success', 'message': f'VM 账号 {name} 创建成功'})}\n\n"
-                    logger.info(f"✅ VM 账号 '{name}' 创建成功")
-                else:
-                    yield f"data: {to_json({'type': 'error', 'message': f'创建失败 (返回码: {process.returncode})'})}\n\n"
-                    logger.error(f"❌ VM 账号创建失败，返回码: {process.returncode}")
+        name = data.get('name', '').strip()
+        app_type = data.get('app_type', '').strip()
+        node = data.get('node', '').strip()
+        region = data.get('region', '').strip().upper()
+        device_id = data.get('device_id', '').strip()
         
-        except Exception as e:
-            logger.error(f"VM 创建失败: {str(e)}", exc_info=True)
-            yield f"data: {to_json({'type': 'error', 'message': str(e)})}\n\n"
+        if not all([name, app_type, node, region]):
+            yield _sse_frame(_SSE_ERROR_PREFIX, '缺少必需参数')
+            return
+        
+        yield from _stream_vm_command(
+            'new', [name, app_type, node, region], device_id, name, '创建',
+            f'开始创建 VM 账号: {name}', f'VM 账号 {name} 创建成功',
+            on_success=lambda: vm_service.increment_account_counter(app_type, region, device_id or None)
+        )
     
-    return Response(generate(data), mimetype='text/event-stream')
+    return _sse_response(_guard_vm_stream(generate(data), '创建'))
 
 
 @app.route('/api/vm/save', methods=['POST'])
@@ -356,108 +767,45 @@ def vm_save_account():
           properties:
             type:
               type: string
-              enum: [log, success, error]
+              enum: [log, log_batch, success, error]
               description: 消息类型
             message:
               type: string
               description: 消息内容
+            lines:
+              type: array
+              items:
+                type: string
+              description: 合并的多行日志（仅 log_batch）
     """
-    import subprocess
-    import shlex
-    from datetime import datetime
-    
     # ⚠️ 重要：在生成器外部获取请求数据
     data = request.json
     
     def generate(data):
-        try:
-            device_id = data.get('device_id', '').strip()
-            
-            # 先获取 AccountName
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            yield f"data: {to_json({'type': 'log', 'message': f'[{timestamp}] 正在获取账号名称...'})}\n\n"
-            success, account_name = vm_service.get_config_value('AccountName', device_id or None)
-            
-            if not success:
-                yield f"data: {to_json({'type': 'error', 'message': f'获取账号名称失败: {account_name}'})}\n\n"
-                return
-            
-            if not account_name:
-                yield f"data: {to_json({'type': 'error', 'message': '账号名称为空'})}\n\n"
-                return
-            
-            yield f"data: {to_json({'type': 'log', 'message': f'账号名称: {account_name}'})}\n\n"
-            
-            # 执行保存命令
-            adb_path = path_manager.get_adb_path()
-            vm_script_path = path_manager.get_vm_script_path()
-            
-            # 转义特殊字符
-            def escape_for_shell(s):
-                return s.replace('\\', '\\\\').replace('"', '\\"').replace('$', '\\$').replace('`', '\\`')
-            
-            escaped_account_name = escape_for_shell(account_name)
-            shell_cmd = f'su -c "sh {vm_script_path} save \\"{escaped_account_name}\\""'
-            
-            cmd = [adb_path, 'shell', shell_cmd]
-            if device_id:
-                cmd = [adb_path, '-s', device_id, 'shell', shell_cmd]
-            
-            logger.info(f"执行 VM 保存命令: {' '.join(cmd)}")
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            yield f"data: {to_json({'type': 'log', 'message': f'[{timestamp}] 开始保存账号: {account_name}'})}\n\n"
-            
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                encoding='utf-8',
-                errors='replace',
-                bufsize=1
-            )
-            
-            # 存储脚本结构化结果
-            script_result = None
-            
-            for line in iter(process.stdout.readline, ''):
-                if line:
-                    line_stripped = line.rstrip()
-                    
-                    # 解析结构化结果: ##RESULT##|status|code|message
-                    if line_stripped.startswith('##RESULT##|'):
-                        parts = line_stripped.split('|', 3)
-                        if len(parts) >= 4:
-                            script_result = {
-                                'status': parts[1],
-                                'code': parts[2],
-                                'message': parts[3]
-                            }
-                    else:
-                        yield f"data: {to_json({'type': 'log', 'message': line_stripped})}\n\n"
-            
-            process.wait()
-            
-            # 优先使用脚本的结构化结果
-            if script_result:
-                if script_result['status'] == 'success':
-                    yield f"data: {to_json({'type': 'success', 'message': script_result['message'], 'exit_code': script_result['code']})}\n\n"
-                    logger.info(f"✅ VM 账号 '{account_name}' 保存成功")
-                else:
-                    yield f"data: {to_json({'type': 'error', 'message': script_result['message'], 'exit_code': script_result['code']})}\n\n"
-                    logger.error(f"❌ VM 账号保存失败: {script_result['message']} (code: {script_result['code']})")
-            else:
-                # 兼容旧版本脚本
-                if process.returncode == 0:
-                    yield f"data: {to_json({'type': 'success', 'message': f'账号 {account_name} 保存成功'})}\n\n"
-                    logger.info(f"✅ VM 账号 '{account_name}' 保存成功")
-                else:
-                    yield f"data: {to_json({'type': 'error', 'message': f'保存失败 (返回码: {process.returncode})'})}\n\n"
+        device_id = data.get('device_id', '').strip()
         
-        except Exception as e:
-            logger.error(f"VM 保存失败: {str(e)}", exc_info=True)
-            yield f"data: {to_json({'type': 'error', 'message': str(e)})}\n\n"
+        # 先获取 AccountName
+        timestamp = _timestamp()
+        yield _sse_frame(_SSE_LOG_PREFIX, f'[{timestamp}] 正在获取账号名称...')
+        success, account_name = vm_service.get_config_value('AccountName', device_id or None)
+        
+        if not success:
+            yield _sse_frame(_SSE_ERROR_PREFIX, f'获取账号名称失败: {account_name}')
+            return
+        
+        if not account_name:
+            yield _sse_frame(_SSE_ERROR_PREFIX, '账号名称为空')
+            return
+        
+        yield _sse_frame(_SSE_LOG_PREFIX, f'账号名称: {account_name}')
+        
+        # 执行保存命令
+        yield from _stream_vm_command(
+            'save', [account_name], device_id, account_name, '保存',
+            f'开始保存账号: {account_name}', f'账号 {account_name} 保存成功'
+        )
     
-    return Response(generate(data), mimetype='text/event-stream')
+    return _sse_response(_guard_vm_stream(generate(data), '保存'))
 
 
 @app.route('/api/vm/load', methods=['POST'])
@@ -493,116 +841,76 @@ def vm_load_account():
           properties:
             type:
               type: string
-              enum: [log, success, error]
+              enum: [log, log_batch, success, error]
               description: 消息类型
             message:
               type: string
               description: 消息内容
+            lines:
+              type: array
+              items:
+                type: string
+              description: 合并的多行日志（仅 log_batch）
     """
-    import subprocess
-    import shlex
-    from datetime import datetime
-    
     # ⚠️ 重要：在生成器外部获取请求数据
     data = request.json
 
     def generate(data):
-        try:
-            name = data.get('name', '').strip()
-            device_id = data.get('device_id', '').strip()
-            logger.info(f"🔍 VM Load - Name: {name}, Device ID: {device_id or 'NOT PROVIDED'}")
-            
-            if not name:
-                yield f"data: {to_json({'type': 'error', 'message': '账号名称不能为空'})}\n\n"
-                return
-            
-            adb_path = path_manager.get_adb_path()
-            vm_script_path = path_manager.get_vm_script_path()
-            
-            # 转义特殊字符
-            def escape_for_shell(s):
-                return s.replace('\\', '\\\\').replace('"', '\\"').replace('$', '\\$').replace('`', '\\`')
-            
-            escaped_name = escape_for_shell(name)
-            shell_cmd = f'su -c "sh {vm_script_path} load \\"{escaped_name}\\""'
-            
-            cmd = [adb_path, 'shell', shell_cmd]
-            if device_id:
-                cmd = [adb_path, '-s', device_id, 'shell', shell_cmd]
-            
-            logger.info(f"执行 VM 加载命令: {' '.join(cmd)}")
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            yield f"data: {to_json({'type': 'log', 'message': f'[{timestamp}] 开始加载账号: {name}'})}\n\n"
-            
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                encoding='utf-8',
-                errors='replace',
-                bufsize=1
-            )
-            
-            # 存储脚本结构化结果
-            script_result = None
-            
-            for line in iter(process.stdout.readline, ''):
-                if line:
-                    line_stripped = line.rstrip()
-                    
-                    # 解析结构化结果: ##RESULT##|status|code|message
-                    if line_stripped.startswith('##RESULT##|'):
-                        parts = line_stripped.split('|', 3)
-                        if len(parts) >= 4:
-                            script_result = {
-                                'status': parts[1],
-                                'code': parts[2],
-                                'message': parts[3]
-                            }
-                    else:
-                        yield f"data: {to_json({'type': 'log', 'message': line_stripped})}\n\n"
-            
-            process.wait()
-            
-            # 优先使用脚本的结构化结果
-            if script_result:
-                if script_result['status'] == 'success':
-                    yield f"data: {to_json({'type': 'success', 'message': script_result['message'], 'exit_code': script_result['code']})}\n\n"
-                    logger.info(f"✅ VM 账号 '{name}' 加载成功")
-                else:
-                    yield f"data: {to_json({'type': 'error', 'message': script_result['message'], 'exit_code': script_result['code']})}\n\n"
-                    logger.error(f"❌ VM 账号加载失败: {script_result['message']} (code: {script_result['code']})")
-            else:
-                # 兼容旧版本脚本
-                if process.returncode == 0:
-                    yield f"data: {to_json({'type': 'success', 'message': f'账号 {name} 加载成功'})}\n\n"
-                    logger.info(f"✅ VM 账号 '{name}' 加载成功")
-                else:
-                    yield f"data: {to_json({'type': 'error', 'message': f'加载失败 (返回码: {process.returncode})'})}\n\n"
+        name = data.get('name', '').strip()
+        device_id = data.get('device_id', '').strip()
+        logger.info("🔍 VM Load - Name: %s, Device ID: %s", name, device_id or 'NOT PROVIDED')
         
-        except Exception as e:
-            logger.error(f"VM 加载失败: {str(e)}", exc_info=True)
-            yield f"data: {to_json({'type': 'error', 'message': str(e)})}\n\n"
+        if not name:
+            yield _sse_frame(_SSE_ERROR_PREFIX, '账号名称不能为空')
+            return
+        
+        yield from _stream_vm_command(
+            'load', [name], device_id, name, '加载',
+            f'开始加载账号: {name}', f'账号 {name} 加载成功'
+        )
     
-    return Response(generate(data), mimetype='text/event-stream')
+    return _sse_response(_guard_vm_stream(generate(data), '加载'))
+
+
+# ==================== API 文档 ====================
+
+@functools.lru_cache(maxsize=1)
+def _apispec_json():
+    """生成并缓存序列化后的 API 文档（路由在启动后不再变化，只需生成一次）"""
+    # YAML 模板中的响应码等是整数键
+    return orjson.dumps(swagger.get_apispecs('apispec'), option=orjson.OPT_NON_STR_KEYS)
+
+
+def apispec():
+    """直接返回缓存的 API 文档 JSON，替代 flasgger 每次请求都重新 jsonify"""
+    return Response(_apispec_json(), mimetype='application/json')
+
+
+app.view_functions['flasgger.apispec'] = apispec
 
 
 # ==================== 应用启动 ====================
 
 if __name__ == '__main__':
-    logger.info("=" * 70)
+    logger.info(LOG_BANNER)
     logger.info("🚀 Proxy Manager 应用启动")
-    logger.info("=" * 70)
-    logger.info(f"📂 工作目录: {os.getcwd()}")
-    logger.info(f"📝 配置文件: {path_manager.get_config_file_path()}")
-    logger.info(f"📱 ADB 路径: {path_manager.get_adb_path()}")
-    logger.info(f"🔧 VM 脚本: {path_manager.get_vm_script_path()}")
-    logger.info("=" * 70)
+    logger.info(LOG_BANNER)
+    logger.info("📂 工作目录: %s", os.getcwd())
+    logger.info("📝 配置文件: %s", path_manager.get_config_file_path())
+    logger.info("📱 ADB 路径: %s", path_manager.get_adb_path())
+    logger.info("🔧 VM 脚本: %s", path_manager.get_vm_script_path())
+    logger.info(LOG_BANNER)
     
     try:
-        app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
+        if DEBUG:
+            app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
+        else:
+            # 使用 waitress 作为生产级 WSGI 服务器（多线程，支持多个 SSE 流并发）
+            # 每个进行中的 VM 操作占用一个线程，可通过 APP_THREADS 调整并发上限
+            from waitress import serve
+            serve(app, host='0.0.0.0', port=5000, threads=int(os.environ.get('APP_THREADS', 8)))
     except KeyboardInterrupt:
         logger.info("\n👋 应用已停止")
     except Exception as e:
-        logger.error(f"❌ 应用运行失败: {str(e)}", exc_info=True)
+        logger.error("❌ 应用运行失败: %s", e, exc_info=True)
 
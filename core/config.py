@@ -4,11 +4,27 @@ Config Manager - 配置管理模块
 """
 
 import os
+import copy
 import yaml
+import logging
 from core.logger import get_logger
+from utils.yaml_helper import (
+    YAMLHelper, YAML_LOADER, YAML_DUMPER, atomic_write, is_transit_proxy, format_proxy_for_display
+)
 
 logger = get_logger(__name__)
 
+# YAMLHelper 无状态，所有 ConfigManager 共用一个实例
+_yaml_helper = YAMLHelper()
+
+# setting.yaml 写入选项：保持块格式便于手动编辑；加大行宽，长字符串不折行
+_SETTING_DUMP_OPTIONS = {
+    'allow_unicode': True,
+    'default_flow_style': False,
+    'sort_keys': False,
+    'width': 4096,
+}
+
 
 class SettingManager:
     """项目配置管理器（setting.yaml）"""
@@ -21,31 +37,47 @@ class SettingManager:
             setting_file: 配置文件路径
         """
         self.setting_file = setting_file
+        # 解析结果缓存 ((路径, 修改时间, 文件大小), 配置字典)，文件未变化时不重复解析
+        self._cache = (None, None)
     
     def load(self):
-        """加载项目配置文件"""
+        """
+        加载项目配置文件
+        
+        文件路径、修改时间和大小均未变化时直接使用缓存的解析结果。调用方会修改返回的字典后再保存，
+        因此每次返回缓存的副本，避免未保存的修改污染缓存或在线程间共享。
+        """
         try:
-            if not os.path.exists(self.setting_file):
-                logger.warning(f"项目配置文件不存在: {self.setting_file}，将创建默认配置")
+            try:
+                st = os.stat(self.setting_file)
+            except FileNotFoundError:
+                logger.warning("项目配置文件不存在: %s，将创建默认配置", self.setting_file)
                 return self._create_default_setting()
             
-            with open(self.setting_file, 'r', encoding='utf-8') as f:
-                setting = yaml.safe_load(f) or {}
-                return setting
+            # 修改时间精度较粗的文件系统上，同一时间片内的改写仍可通过文件大小区分
+            key = (self.setting_file, st.st_mtime_ns, st.st_size)
+            cached_key, cached = self._cache
+            if cached_key != key:
+                # 以二进制方式交给 libyaml 自行解码，省去 Python 文本层的解码和换行处理
+                with open(self.setting_file, 'rb') as f:
+                    cached = yaml.load(f, Loader=YAML_LOADER) or {}
+                self._cache = (key, cached)
+            return copy.deepcopy(cached)
         except Exception as e:
-            logger.error(f"加载项目配置文件失败: {str(e)}", exc_info=True)
+            logger.error("加载项目配置文件失败: %s", e, exc_info=True)
             return {}
     
     def save(self, setting):
         """保存项目配置文件"""
         try:
             os.makedirs(os.path.dirname(self.setting_file), exist_ok=True)
-            with open(self.setting_file, 'w', encoding='utf-8') as f:
-                yaml.dump(setting, f, allow_unicode=True, default_flow_style=False, sort_keys=False)
+            with atomic_write(self.setting_file) as f:
+                yaml.dump(setting, f, Dumper=YAML_DUMPER, **_SETTING_DUMP_OPTIONS)
+            self._cache = (None, None)
             logger.info("项目配置文件保存成功")
             return True
         except Exception as e:
-            logger.error(f"保存项目配置文件失败: {str(e)}", exc_info=True)
+            logger.error("保存项目配置文件失败: %s", e, exc_info=True)
             raise Exception(f"保存项目配置文件失败: {str(e)}")
     
     def _create_default_setting(self):
@@ -77,8 +109,8 @@ class SettingManager:
             'vm_accounts_file_path': 'config/vm_accounts.yaml',
             'vm_model_config_path': '/data/local/tmp/vm_model_config.yaml'
         }
-        with open(self.setting_file, 'w', encoding='utf-8') as f:
-            yaml.dump(default_setting, f, allow_unicode=True, default_flow_style=False)
+        with atomic_write(self.setting_file) as f:
+            yaml.dump(default_setting, f, Dumper=YAML_DUMPER, **_SETTING_DUMP_OPTIONS)
         return default_setting
 
 
@@ -112,17 +144,14 @@ class ConfigManager:
     
     def load(self, device_id=None):
         """加载网络配置文件"""
-        from utils.yaml_helper import YAMLHelper
-        
         config_file = self.get_config_file(device_id)
         
         if not os.path.exists(config_file):
-            logger.warning(f"📂 配置文件不存在: {config_file}")
+            logger.warning("📂 配置文件不存在: %s", config_file)
             return {}
         
         # 使用 YAMLHelper 加载配置
-        yaml_helper = YAMLHelper()
-        config = yaml_helper.load_yaml_file(config_file)
+        config = _yaml_helper.load_yaml_file(config_file)
         
         # 确保 proxies 是列表
         if config.get('proxies') is None:
@@ -137,8 +166,6 @@ class ConfigManager:
     
     def save(self, config, device_id=None):
         """保存网络配置文件"""
-        from utils.yaml_helper import YAMLHelper
-        
         config_file = self.get_config_file(device_id)
         
         # 确保目录存在
@@ -148,16 +175,18 @@ class ConfigManager:
         if config.get('proxies') is None:
             config['proxies'] = []
         
-        yaml_helper = YAMLHelper()
-        yaml_helper.save_yaml_file(config_file, config)
-        
-        # 统计
-        from utils.yaml_helper import is_transit_proxy, format_proxy_for_display
-        all_proxies = config.get('proxies', [])
-        transit_count = sum(1 for p in all_proxies if is_transit_proxy(format_proxy_for_display(p)))
-        proxy_count = len(all_proxies) - transit_count
-        
-        logger.info(f"💾 配置已保存 | file={config_file}, proxies={proxy_count}, transit={transit_count}")
+        _yaml_helper.save_yaml_file(config_file, config)
+        
+        # 统计（单次遍历，仅在输出 INFO 日志时计算）
+        if logger.isEnabledFor(logging.INFO):
+            transit_count = 0
+            proxy_count = 0
+            for p in config['proxies']:
+                if is_transit_proxy(format_proxy_for_display(p)):
+                    transit_count += 1
+                else:
+                    proxy_count += 1
+            logger.info("💾 配置已保存 | file=%s, proxies=%d, transit=%d", config_file, proxy_count, transit_count)
         return True
     
     def _migrate_proxies_dialer(self, config):
@@ -167,15 +196,13 @@ class ConfigManager:
         if 'proxies' not in config:
             config['proxies'] = []
         
-        migrated_count = 0
-        for proxy in config['proxies_dialer']:
-            if isinstance(proxy, dict):
-                proxy['IsBase'] = True
-                config['proxies'].insert(0, proxy)
-                migrated_count += 1
+        # 一次性插入到列表开头（逆序，与逐个插入到开头的结果一致）
+        dialers = [dict(proxy, IsBase=True) for proxy in config['proxies_dialer'] if isinstance(proxy, dict)]
+        config['proxies'][:0] = dialers[::-1]
+        migrated_count = len(dialers)
         
         del config['proxies_dialer']
-        logger.info(f"成功迁移 {migrated_count} 个中转线路到 proxies，已删除 proxies_dialer")
+        logger.info("成功迁移 %d 个中转线路到 proxies，已删除 proxies_dialer", migrated_count)
         
         return config
 
@@ -7,6 +7,12 @@ import os
 import logging
 from logging.handlers import RotatingFileHandler
 
+# 日志分隔线（启动信息等使用）
+LOG_BANNER = "=" * 70
+
+# 当前生效的文件日志配置，重复调用 setup_logging 且配置相同时直接跳过
+_logging_signature = None
+
 
 def setup_logging(setting_config):
     """
@@ -15,6 +21,7 @@ def setup_logging(setting_config):
     Args:
         setting_config: 项目配置字典，包含 logging 配置项
     """
+    global _logging_signature
     logger = logging.getLogger(__name__)
     
     try:
@@ -38,6 +45,11 @@ def setup_logging(setting_config):
         log_format = log_config.get('log_format', '%(asctime)s [%(levelname)s] [%(filename)s:%(lineno)d] %(message)s')
         date_format = log_config.get('date_format', '%Y-%m-%d %H:%M:%S')
         
+        # 配置未变化时不重复创建处理器（避免重复打开日志文件）
+        signature = (log_file, log_level_str, max_bytes, backup_count, log_format, date_format)
+        if signature == _logging_signature:
+            return
+        
         # 转换日志级别
         log_level = getattr(logging, log_level_str.upper(), logging.INFO)
         
@@ -54,8 +66,10 @@ def setup_logging(setting_config):
         root_logger = logging.getLogger()
         root_logger.setLevel(log_level)
         
-        # 清除现有的处理器
-        root_logger.handlers.clear()
+        # 移除并关闭现有的处理器，释放已打开的日志文件
+        for handler in root_logger.handlers[:]:
+            root_logger.removeHandler(handler)
+            handler.close()
         
         # 1. 控制台处理器
         console_handler = logging.StreamHandler()
@@ -73,8 +87,9 @@ def setup_logging(setting_config):
         file_handler.setLevel(log_level)
         file_handler.setFormatter(formatter)
         root_logger.addHandler(file_handler)
+        _logging_signature = signature
         
-        logger.info("=" * 70)
+        logger.info(LOG_BANNER)
         logger.info("📝 日志系统配置完成")
         logger.info(f"  - 日志文件: {log_file}")
         logger.info(f"  - 日志级别: {log_level_str}")
@@ -82,7 +97,7 @@ def setup_logging(setting_config):
         logger.info(f"  - 保留文件数: {backup_count}")
         logger.info(f"  - 控制台输出: 已启用")
         logger.info(f"  - 文件输出: 已启用")
-        logger.info("=" * 70)
+        logger.info(LOG_BANNER)
         
     except Exception as e:
         # 如果配置失败，使用基本配置
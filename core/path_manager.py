@@ -3,10 +3,20 @@ Path Manager - 路径管理模块
 统一管理所有配置文件路径
 """
 
+import os
 from core.logger import get_logger
 
 logger = get_logger(__name__)
 
+# 路径缓存键 -> (设置项名称, 默认值)；设置项缺失或为空时使用默认值
+_DEFAULTS = {
+    'config_file': ('config_file_path', 'config.yaml'),
+    'vm_script': ('vm_script_path', 'vm.sh'),
+    'adb': ('adb_path', 'adb'),
+    'vm_accounts': ('vm_accounts_file_path', 'config/vm_accounts.yaml'),
+    'vm_model_config': ('vm_model_config_path', '/data/local/tmp/vm_model_config.yaml'),
+}
+
 
 class PathManager:
     """路径管理器，负责管理和缓存各种文件路径"""
@@ -20,45 +30,48 @@ class PathManager:
         """
         self.setting_manager = setting_manager
         self._cached_paths = {}
+        # 缓存路径时设置文件的修改时间，文件被修改（包括手动编辑）后缓存自动失效
+        self._setting_mtime = None
+    
+    def _ensure_loaded(self):
+        """缓存为空或设置文件被修改时，一次读取设置并填充所有路径"""
+        try:
+            mtime = os.stat(self.setting_manager.setting_file).st_mtime_ns
+        except OSError:
+            mtime = None
+        if self._cached_paths and mtime == self._setting_mtime:
+            return
+        
+        setting = self.setting_manager.load()
+        self._cached_paths = {
+            name: setting.get(key) or default
+            for name, (key, default) in _DEFAULTS.items()
+        }
+        self._setting_mtime = mtime
     
     def get_config_file_path(self):
         """获取网络配置文件路径"""
-        if 'config_file' not in self._cached_paths:
-            setting = self.setting_manager.load()
-            path = setting.get('config_file_path', 'config.yaml')
-            self._cached_paths['config_file'] = path if path else 'config.yaml'
+        self._ensure_loaded()
         return self._cached_paths['config_file']
     
     def get_vm_script_path(self):
         """获取 VM 脚本路径"""
-        if 'vm_script' not in self._cached_paths:
-            setting = self.setting_manager.load()
-            path = setting.get('vm_script_path', 'vm.sh')
-            self._cached_paths['vm_script'] = path if path else 'vm.sh'
+        self._ensure_loaded()
         return self._cached_paths['vm_script']
     
     def get_adb_path(self):
         """获取 ADB 可执行文件路径"""
-        if 'adb' not in self._cached_paths:
-            setting = self.setting_manager.load()
-            path = setting.get('adb_path', 'adb')
-            self._cached_paths['adb'] = path if path else 'adb'
+        self._ensure_loaded()
         return self._cached_paths['adb']
     
     def get_vm_accounts_file_path(self):
         """获取多账号动态配置文件路径"""
-        if 'vm_accounts' not in self._cached_paths:
-            setting = self.setting_manager.load()
-            path = setting.get('vm_accounts_file_path', 'config/vm_accounts.yaml')
-            self._cached_paths['vm_accounts'] = path if path else 'config/vm_accounts.yaml'
+        self._ensure_loaded()
         return self._cached_paths['vm_accounts']
     
     def get_vm_model_config_path(self):
         """获取 VM 机型配置路径"""
-        if 'vm_model_config' not in self._cached_paths:
-            setting = self.setting_manager.load()
-            path = setting.get('vm_model_config_path', '/data/local/tmp/vm_model_config.yaml')
-            self._cached_paths['vm_model_config'] = path if path else '/data/local/tmp/vm_model_config.yaml'
+        self._ensure_loaded()
         return self._cached_paths['vm_model_config']
     
     def clear_cache(self):
@@ -22,7 +22,9 @@ Write-Host ""
 Write-Host "[2/3] 检查依赖包..." -ForegroundColor Green
 
 try {
-    python -c "import flask" 2>&1 | Out-Null
+    # 探测 app.py 启动时导入的全部第三方依赖，任一缺失都会重新安装
+    python -c "import flask, yaml, flasgger, orjson, waitress" 2>&1 | Out-Null
+    if ($LASTEXITCODE -ne 0) { throw "缺少依赖包" }
     Write-Host "依赖包已安装" -ForegroundColor Green
 } catch {
     Write-Host "正在安装依赖包..." -ForegroundColor Yellow
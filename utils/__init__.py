@@ -4,7 +4,8 @@ Utils Module - 工具模块
 """
 
 from .adb_helper import ADBHelper
-from .yaml_helper import YAMLHelper, format_proxy_for_display, is_transit_proxy
+from .yaml_helper import YAMLHelper, format_proxy_for_display, is_transit_proxy, atomic_write
+from .json_provider import OrjsonProvider
 
-__all__ = ['ADBHelper', 'YAMLHelper', 'format_proxy_for_display', 'is_transit_proxy']
+__all__ = ['ADBHelper', 'YAMLHelper', 'format_proxy_for_display', 'is_transit_proxy', 'atomic_write', 'OrjsonProvider']
 
@@ -0,0 +1,85 @@
+"""
+JSON Provider - 基于 orjson 的 Flask JSON 序列化
+替换 Flask 默认的标准库 json，jsonify / request.get_json 统一使用 orjson
+"""
+
+import orjson
+from flask import g, has_request_context
+from flask.json.provider import DefaultJSONProvider
+
+# 配置数据中可能出现非字符串键（如 YAML 中的数字键）
+_DUMPS_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+# 请求上下文 g 中保存 JSON 响应原始数据的属性名（响应日志直接读取，无需重新解析响应体）
+JSON_PAYLOAD_KEY = '_json_payload'
+
+# orjson 紧凑输出使用的分隔符
+_COMPACT_SEPARATORS = (',', ':')
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """orjson JSON 提供者（orjson 直接输出 UTF-8，无需 JSON_AS_ASCII 配置）"""
+
+    def dumps(self, obj, **kwargs):
+        """
+        序列化为 JSON 字符串
+
+        标准库 json 的参数中，orjson 能表达的转换为对应选项；其余参数无法等价实现，直接报错而非静默忽略
+        """
+        return orjson.dumps(obj, **_orjson_dumps_args(kwargs, self.default)).decode()
+
+    def loads(self, s, **kwargs):
+        """解析 JSON 字符串或字节"""
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """构建 JSON 响应，直接使用 orjson 输出的字节，省去 str 编解码"""
+        if args and kwargs:
+            raise TypeError('app.json.response() 只能传入位置参数或关键字参数之一')
+        if not args and not kwargs:
+            obj = None
+        elif len(args) == 1:
+            obj = args[0]
+        else:
+            obj = args or kwargs
+
+        if has_request_context():
+            setattr(g, JSON_PAYLOAD_KEY, obj)
+
+        option = _DUMPS_OPTIONS | orjson.OPT_APPEND_NEWLINE
+        # 与 Flask 默认行为一致：调试模式或 compact=False 时缩进输出
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+        body = orjson.dumps(obj, default=self.default, option=option)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def _orjson_dumps_args(kwargs, default):
+    """将标准库 json.dumps 的参数转换为 orjson.dumps 的参数，不支持的参数抛出 TypeError"""
+    option = _DUMPS_OPTIONS
+    kwargs = dict(kwargs)
+
+    default = kwargs.pop('default', default)
+    if kwargs.pop('sort_keys', False):
+        option |= orjson.OPT_SORT_KEYS
+
+    indent = kwargs.pop('indent', None)
+    if indent is not None:
+        if indent != 2:
+            raise TypeError(f'orjson 仅支持 2 空格缩进，不支持 indent={indent!r}')
+        option |= orjson.OPT_INDENT_2
+
+    separators = kwargs.pop('separators', None)
+    if separators is not None and tuple(separators) != _COMPACT_SEPARATORS:
+        # orjson 紧凑输出固定使用 (',', ':')，缩进输出时由 orjson 自行处理分隔符
+        if indent is None:
+            raise TypeError(f'orjson 不支持 separators={separators!r}')
+
+    # orjson 始终输出 UTF-8 原文，仅能满足 ensure_ascii=False
+    if kwargs.pop('ensure_ascii', False):
+        raise TypeError('orjson 不支持 ensure_ascii=True')
+
+    if kwargs:
+        raise TypeError(f'orjson 不支持的参数: {", ".join(sorted(kwargs))}')
+
+    return {'default': default, 'option': option}
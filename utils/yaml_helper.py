@@ -4,12 +4,25 @@ YAML Helper - YAML 文件处理辅助模块
 """
 
 import os
+import re
+import time
 import yaml
 import json
+import tempfile
+from contextlib import contextmanager
 from core.logger import get_logger
 
 logger = get_logger(__name__)
 
+# 优先使用 libyaml 的 C 实现，未安装 libyaml 时回退到纯 Python 实现
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+# proxies / proxy-groups 区域：从 "xxx:" 后的换行符开始，匹配所有内容（包括注释、空行、条目），
+# 直到遇到 "# ====" 开头的注释行（不包括该行）；模块加载时编译一次，保存时直接复用
+_PROXIES_SECTION_RE = re.compile(r'(proxies:\n)((?:.*\n)*?)(?=# ====)', re.MULTILINE)
+_PROXY_GROUPS_SECTION_RE = re.compile(r'(proxy-groups:\n)((?:.*\n)*?)(?=# ====)', re.MULTILINE)
+
 
 def format_proxy_for_display(proxy):
     """格式化代理配置用于显示"""
@@ -31,9 +44,53 @@ def is_transit_proxy(proxy_dict):
     return is_base == True or is_base == 'true' or str(is_base).lower() == 'true'
 
 
-def to_json(data):
-    """将数据转换为 JSON 字符串（用于 SSE 响应）"""
-    return json.dumps(data, ensure_ascii=False)
+# 进程的 umask（导入时读取一次；os.umask 只能通过设置来读取，运行期调用不是线程安全的）
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# Windows 下目标文件被其他线程打开时 os.replace 会抛出 PermissionError，短暂重试
+_REPLACE_RETRIES = 10 if os.name == 'nt' else 0
+_REPLACE_RETRY_DELAY = 0.05
+
+
+def _replace_with_retry(src, dst):
+    """os.replace，Windows 下目标文件被占用时短暂重试"""
+    for _ in range(_REPLACE_RETRIES):
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            time.sleep(_REPLACE_RETRY_DELAY)
+    os.replace(src, dst)
+
+
+@contextmanager
+def atomic_write(file_path):
+    """
+    原子写入文本文件：先写入同目录下的临时文件，成功后再替换目标文件
+    
+    写入过程中出错或进程中断时原文件保持不变，其他读取者也不会读到写了一半的文件。
+    
+    Args:
+        file_path: 目标文件路径
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            yield f
+        # 临时文件默认仅所有者可读写：沿用原文件权限，新文件按 umask 使用与 open() 相同的默认权限
+        try:
+            mode = os.stat(file_path).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(tmp_path, mode)
+        _replace_with_retry(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
 
 
 class YAMLHelper:
@@ -63,13 +120,13 @@ class YAMLHelper:
             
             # 尝试解析
             try:
-                config = yaml.safe_load(cleaned_content)
+                config = yaml.load(cleaned_content, Loader=YAML_LOADER)
                 return config if config else {}
             except yaml.YAMLError as e:
                 logger.error(f"YAML解析失败: {str(e)}")
                 # 尝试修复
                 fixed_content = YAMLHelper._fix_yaml_content(content)
-                config = yaml.safe_load(fixed_content)
+                config = yaml.load(fixed_content, Loader=YAML_LOADER)
                 return config if config else {}
                 
         except Exception as e:
@@ -104,36 +161,21 @@ class YAMLHelper:
             new_proxy_groups_content = YAMLHelper._generate_proxy_groups_section(config)
             
             # 替换 proxies 部分
-            import re
-            
-            # 匹配 proxies 部分：
-            # - 从 "proxies:" 后的换行符开始
-            # - 匹配所有内容（包括注释、空行、代理条目）
-            # - 直到遇到 "# ====" 开头的注释行（不包括该行）
-            proxies_pattern = r'(proxies:\n)((?:.*\n)*?)(?=# ====)'
-            original_content = re.sub(
-                proxies_pattern,
+            original_content = _PROXIES_SECTION_RE.sub(
                 f'\\1{new_proxies_content}\n',
                 original_content,
-                count=1,
-                flags=re.MULTILINE
+                count=1
             )
             
-            # 替换 proxy-groups 部分：
-            # - 从 "proxy-groups:" 后的换行符开始
-            # - 匹配所有内容
-            # - 直到遇到 "# ====" 开头的注释行（不包括该行）
-            proxy_groups_pattern = r'(proxy-groups:\n)((?:.*\n)*?)(?=# ====)'
-            original_content = re.sub(
-                proxy_groups_pattern,
+            # 替换 proxy-groups 部分
+            original_content = _PROXY_GROUPS_SECTION_RE.sub(
                 f'\\1{new_proxy_groups_content}\n',
                 original_content,
-                count=1,
-                flags=re.MULTILINE
+                count=1
             )
             
             # 写入文件
-            with open(file_path, 'w', encoding='utf-8') as f:
+            with atomic_write(file_path) as f:
                 f.write(original_content)
             
             logger.info(f"✅ 配置文件保存成功（只修改了 proxies 和 proxy-groups）: {file_path}")
@@ -201,7 +243,7 @@ class YAMLHelper:
     @staticmethod
     def _write_new_config_file(file_path, config):
         """写入新配置文件（用于文件不存在的情况）"""
-        with open(file_path, 'w', encoding='utf-8') as f:
+        with atomic_write(file_path) as f:
             # 写入基础设置
             YAMLHelper._write_basic_settings(f, config)
             
@@ -232,7 +274,7 @@ class YAMLHelper:
             # 写入 rules
             if 'rules' in config:
                 f.write("\n# ==================== 规则 ====================\n")
-                yaml.dump({'rules': config['rules']}, f, allow_unicode=True, default_flow_style=False, sort_keys=False)
+                yaml.dump({'rules': config['rules']}, f, Dumper=YAML_DUMPER, allow_unicode=True, default_flow_style=False, sort_keys=False)
             
             # 写入 redir-port
             if 'redir-port' in config: